@@ -0,0 +1,94 @@
+"""Compare file size and encode/decode speed of the storage codecs.
+
+Runs against the largest guilds in the data directory, plus a synthetic
+guild so the numbers mean something even when real guilds are small.
+
+    python benchmark_storage.py [--data-dir data] [--guilds 3] [--synthetic-users 50000]
+"""
+import argparse
+import os
+import random
+import time
+from typing import Any, Dict
+
+from config import Config
+from storage_codec import CODECS, CorruptFileError, decode_file, encode_file, read_file
+
+GUILD_FILES = ['users.json', 'stock.json', 'pending_purchases.json', 'config.json']
+
+def synthetic_guild(user_count: int) -> Dict[str, Any]:
+    """Build guild data shaped like a busy server"""
+    rng = random.Random(0)
+    stock = {
+        f"Item {i}": {'cost': rng.randint(10, 500), 'description': f"Reward number {i}", 'quantity': None, 'per_user_limit': None}
+        for i in range(50)
+    }
+    users = {}
+    pending = {}
+    for _ in range(user_count):
+        user_str = str(rng.randint(10 ** 17, 10 ** 19))
+        users[user_str] = {'balance': rng.randint(0, 50000), 'purchases': {f"Item {rng.randint(0, 49)}": rng.randint(1, 5)}}
+        if rng.random() < 0.1:
+            pending[user_str] = [
+                {'id': f"{rng.getrandbits(128):032x}", 'item': f"Item {rng.randint(0, 49)}", 'cost': rng.randint(10, 500),
+                 'timestamp': str(1755600000 + rng.randint(0, 10 ** 6)), 'held': True}
+            ]
+    return {'users.json': users, 'stock.json': stock, 'pending_purchases.json': pending, 'config.json': {}}
+
+def load_guild(guild_dir: str) -> Dict[str, Any]:
+    """Load every readable file of a guild"""
+    files = {}
+    for file_name in GUILD_FILES:
+        try:
+            files[file_name] = read_file(os.path.join(guild_dir, file_name))
+        except (FileNotFoundError, CorruptFileError):
+            continue
+    return files
+
+def time_call(func, repeat: int) -> float:
+    """Best time in milliseconds over several runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def benchmark_guild(name: str, files: Dict[str, Any], repeat: int):
+    """Print size and timings of every codec for one guild"""
+    print(f"\n{name}")
+    print(f"  {'codec':<8} {'size':>12} {'vs json':>8} {'encode ms':>10} {'decode ms':>10}")
+    baseline = None
+    for codec_name in CODECS:
+        encoded = {file_name: encode_file(data, codec_name) for file_name, data in files.items()}
+        size = sum(len(raw) for raw in encoded.values())
+        baseline = baseline or size
+        encode_ms = time_call(lambda: [encode_file(data, codec_name) for data in files.values()], repeat)
+        decode_ms = time_call(lambda: [decode_file(raw) for raw in encoded.values()], repeat)
+        print(f"  {codec_name:<8} {size:>12,} {size / baseline:>7.0%} {encode_ms:>10.2f} {decode_ms:>10.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the storage codecs")
+    parser.add_argument('--data-dir', default=Config.DATA_DIR, help="data directory to read guilds from")
+    parser.add_argument('--guilds', type=int, default=3, help="number of largest guilds to benchmark")
+    parser.add_argument('--synthetic-users', type=int, default=50000, help="users in the synthetic guild (0 to skip)")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per measurement, the best is reported")
+    args = parser.parse_args(argv)
+
+    guild_dirs = []
+    if os.path.isdir(args.data_dir):
+        guild_dirs = [
+            os.path.join(args.data_dir, entry)
+            for entry in os.listdir(args.data_dir)
+            if entry.startswith('guild_') and os.path.isdir(os.path.join(args.data_dir, entry))
+        ]
+    guild_dirs.sort(key=lambda d: sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d)), reverse=True)
+
+    for guild_dir in guild_dirs[:args.guilds]:
+        benchmark_guild(os.path.basename(guild_dir), load_guild(guild_dir), args.repeat)
+
+    if args.synthetic_users:
+        benchmark_guild(f"synthetic ({args.synthetic_users:,} users)", synthetic_guild(args.synthetic_users), args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Offline integrity checker for the bot's data directory.
+
+Scans every data/guild_* directory in parallel, validates each file against
+the schema DataManager writes, and reports corrupt files, orphaned data,
+duplicate pending purchases and per-guild stats. Run with --repair to fix
+what can be fixed safely; every rewrite is atomic and keeps a backup of the
+original. Files that fail to load are never rewritten: they are reported as
+needing manual recovery, the rest of that guild is left untouched, and the
+run exits non-zero.
+
+    python check_data.py [--data-dir data] [--workers N] [--repair] [--json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from config import Config
+from storage_codec import CorruptFileError, read_file, write_file
+
+GUILD_FILES = ['users.json', 'stock.json', 'pending_purchases.json', 'config.json']
+LEGACY_FILES = ['users.json', 'stock.json', 'pending_purchases.json']
+DEFAULT_CONFIG = {
+    "approval_channel_id": None,
+    "approval_role_id": None,
+    "setup_complete": False
+}
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_snowflake(key: str) -> bool:
+    return key.isdigit()
+
+def load_file(file_path: str, issues: List[str], corrupt: Optional[List[str]] = None) -> Optional[Any]:
+    """Load a data file in any supported format, recording a problem instead of raising"""
+    file_name = os.path.basename(file_path)
+    try:
+        return read_file(file_path)
+    except FileNotFoundError:
+        issues.append(f"{file_name}: missing")
+    except CorruptFileError as e:
+        issues.append(f"{file_name}: corrupt ({e}), needs manual recovery")
+        if corrupt is not None:
+            corrupt.append(file_name)
+    return None
+
+def check_users(users: Any, issues: List[str]) -> Dict[str, Any]:
+    """Validate users.json and return a cleaned copy"""
+    if not isinstance(users, dict):
+        issues.append("users.json: top level is not an object")
+        return {}
+
+    cleaned = {}
+    for user_str, user in users.items():
+        if not _is_snowflake(user_str):
+            issues.append(f"users.json: invalid user id {user_str!r}")
+            continue
+        if not isinstance(user, dict) or not _is_int(user.get('balance')):
+            issues.append(f"users.json: user {user_str} has no valid balance")
+            user = {'balance': 0}
+        elif user['balance'] < 0:
+            issues.append(f"users.json: user {user_str} has negative balance {user['balance']}")
+            user = {**user, 'balance': 0}
+
+        purchases = user.get('purchases')
+        if purchases is not None and not (isinstance(purchases, dict) and all(_is_int(v) for v in purchases.values())):
+            issues.append(f"users.json: user {user_str} has an invalid purchase history")
+            user = {k: v for k, v in user.items() if k != 'purchases'}
+
+        cleaned[user_str] = user
+    return cleaned
+
+def check_stock(stock: Any, issues: List[str]) -> Dict[str, Any]:
+    """Validate stock.json and return a cleaned copy"""
+    if not isinstance(stock, dict):
+        issues.append("stock.json: top level is not an object")
+        return {}
+
+    cleaned = {}
+    for item_name, item in stock.items():
+        if not isinstance(item, dict) or not _is_int(item.get('cost')) or item['cost'] <= 0:
+            issues.append(f"stock.json: item {item_name!r} has no valid cost, dropping it")
+            continue
+        item = dict(item)
+        if not isinstance(item.get('description', ''), str):
+            issues.append(f"stock.json: item {item_name!r} has a non-text description")
+            item['description'] = str(item['description'])
+        for key in ('quantity', 'per_user_limit', 'reserved'):
+            value = item.get(key)
+            if value is not None and (not _is_int(value) or value < 0):
+                issues.append(f"stock.json: item {item_name!r} has invalid {key} {value!r}")
+                item[key] = 0 if key == 'reserved' else None
+        cleaned[item_name] = item
+    return cleaned
+
+def check_pending(pending: Any, stock: Optional[Dict[str, Any]], issues: List[str]) -> Dict[str, Any]:
+    """Validate pending_purchases.json, dropping duplicates and empty entries.
+
+    Pass stock=None when stock.json could not be loaded to skip the checks against it.
+    """
+    if not isinstance(pending, dict):
+        issues.append("pending_purchases.json: top level is not an object")
+        return {}
+
+    cleaned = {}
+    seen_ids = set()
+    for user_str, purchases in pending.items():
+        if not _is_snowflake(user_str) or not isinstance(purchases, list):
+            issues.append(f"pending_purchases.json: invalid entry for {user_str!r}")
+            continue
+
+        kept = []
+        identical = Counter()
+        for purchase in purchases:
+            if not (isinstance(purchase, dict) and isinstance(purchase.get('item'), str)
+                    and _is_int(purchase.get('cost')) and str(purchase.get('timestamp', '')).isdigit()):
+                issues.append(f"pending_purchases.json: malformed purchase for user {user_str}: {purchase!r}")
+                continue
+
+            purchase_id = purchase.get('id')
+            if purchase_id is None:
+                purchase = {**purchase, 'id': uuid.uuid4().hex}
+            elif purchase_id in seen_ids:
+                issues.append(f"pending_purchases.json: duplicate purchase id {purchase_id} for user {user_str}")
+                continue
+            seen_ids.add(purchase['id'])
+
+            # reserve_purchase only sets held=True after the points are deducted
+            if purchase.get('held') is False:
+                issues.append(f"pending_purchases.json: purchase {purchase['id']} of {purchase['item']!r} for user {user_str} "
+                              f"was interrupted while holding {purchase['cost']} points; check the balance before approving or denying it")
+
+            if stock is not None and purchase['item'] not in stock:
+                issues.append(f"pending_purchases.json: user {user_str} has a pending purchase of {purchase['item']!r}, which is not in stock")
+
+            identical[(purchase['item'], purchase['cost'], str(purchase['timestamp']))] += 1
+            kept.append(purchase)
+
+        # Same item bought twice in the same second is usually a double click, but
+        # can be legitimate, so it is reported and left for staff to resolve
+        for (item_name, cost, timestamp), count in identical.items():
+            if count > 1:
+                issues.append(f"pending_purchases.json: user {user_str} has {count} identical purchases of {item_name!r} at {timestamp} (possible duplicate)")
+
+        if kept:
+            cleaned[user_str] = kept
+        else:
+            issues.append(f"pending_purchases.json: user {user_str} has an empty purchase list")
+    return cleaned
+
+def check_reservations(stock: Dict[str, Any], pending: Dict[str, Any], issues: List[str]):
+    """Make each limited item's reserved count match its reserved pending purchases"""
+    reserved = Counter(
+        purchase['item']
+        for purchases in pending.values()
+        for purchase in purchases
+        if purchase.get('reserved')
+    )
+    for item_name, item in stock.items():
+        if item.get('quantity') is None and not item.get('reserved'):
+            continue
+        expected = reserved.get(item_name, 0)
+        if item.get('reserved', 0) != expected:
+            issues.append(f"stock.json: item {item_name!r} has reserved={item.get('reserved', 0)} but {expected} pending reservation(s)")
+            item['reserved'] = expected
+
+def check_config(config: Any, issues: List[str]) -> Dict[str, Any]:
+    """Validate config.json and fill in missing keys"""
+    if not isinstance(config, dict):
+        issues.append("config.json: top level is not an object")
+        return dict(DEFAULT_CONFIG)
+
+    cleaned = dict(config)
+    for key, default in DEFAULT_CONFIG.items():
+        if key not in cleaned:
+            issues.append(f"config.json: missing {key}")
+            cleaned[key] = default
+    for key in ('approval_channel_id', 'approval_role_id'):
+        if cleaned[key] is not None and not _is_int(cleaned[key]):
+            issues.append(f"config.json: {key} is not an id")
+            cleaned[key] = None
+    return cleaned
+
+def check_guild(guild_dir: str, repair: bool = False, codec: str = Config.STORAGE_CODEC) -> Dict[str, Any]:
+    """Check one guild directory; runs in a worker process"""
+    issues: List[str] = []
+    name = os.path.basename(guild_dir)
+
+    backups = 0
+    for entry in sorted(os.listdir(guild_dir)):
+        if '.bak-' in entry:
+            backups += 1
+        elif entry not in GUILD_FILES:
+            issues.append(f"{entry}: unexpected file (orphaned)")
+
+    corrupt: List[str] = []
+    raw = {file_name: load_file(os.path.join(guild_dir, file_name), issues, corrupt) for file_name in GUILD_FILES}
+
+    users = check_users(raw['users.json'] if raw['users.json'] is not None else {}, issues)
+    stock = check_stock(raw['stock.json'] if raw['stock.json'] is not None else {}, issues)
+    pending = check_pending(raw['pending_purchases.json'] if raw['pending_purchases.json'] is not None else {},
+                            None if 'stock.json' in corrupt else stock, issues)
+    # Cross-file checks against a file that failed to load would only report noise
+    if 'stock.json' not in corrupt and 'pending_purchases.json' not in corrupt:
+        check_reservations(stock, pending, issues)
+    config = check_config(raw['config.json'] if raw['config.json'] is not None else dict(DEFAULT_CONFIG), issues)
+
+    if 'users.json' not in corrupt:
+        for user_str in pending:
+            if user_str not in users:
+                issues.append(f"pending_purchases.json: user {user_str} has pending purchases but no account")
+
+    # Collapse repeated findings so one bad item doesn't flood the report
+    counts = Counter(issues)
+    issues = [issue if counts[issue] == 1 else f"{issue} (x{counts[issue]})" for issue in dict.fromkeys(issues)]
+
+    repaired = []
+    # A file that failed to load would be rewritten from an empty stand-in, wiping it, and the
+    # other files in the guild are checked against it, so the whole guild is left for a human
+    if repair and issues and not corrupt:
+        fixed = {
+            'users.json': users,
+            'stock.json': stock,
+            'pending_purchases.json': pending,
+            'config.json': config
+        }
+        for file_name, data in fixed.items():
+            file_path = os.path.join(guild_dir, file_name)
+            if data == raw[file_name]:
+                continue
+            # Keep the original around in case a repair dropped something staff still want
+            if os.path.exists(file_path):
+                shutil.copy2(file_path, f"{file_path}.bak-{int(time.time())}")
+            write_file(file_path, data, codec)
+            repaired.append(file_name)
+
+    stats = {
+        'users': len(users),
+        'total_balance': sum(u['balance'] for u in users.values()),
+        'items': len(stock),
+        'pending': sum(len(p) for p in pending.values()),
+        'pending_value': sum(p['cost'] for purchases in pending.values() for p in purchases),
+        'setup_complete': bool(config.get('setup_complete')),
+        'backups': backups
+    }
+    return {'guild': name, 'issues': issues, 'repaired': repaired, 'manual_recovery': corrupt, 'stats': stats}
+
+def check_top_level(data_dir: str) -> List[str]:
+    """Report legacy and unexpected files outside the guild directories"""
+    issues = []
+    for file_name in LEGACY_FILES:
+        file_path = os.path.join(data_dir, file_name)
+        if os.path.exists(file_path):
+            issues.append(f"{file_name}: legacy pre-guild file, no longer read by the bot")
+
+    server_configs = os.path.join(data_dir, 'server_configs.json')
+    if os.path.exists(server_configs):
+        data = load_file(server_configs, issues)
+        if data == {}:
+            issues.append("server_configs.json: empty global config file")
+    return issues
+
+def run_checks(data_dir: str, repair: bool = False, workers: Optional[int] = None, codec: str = Config.STORAGE_CODEC) -> Dict[str, Any]:
+    """Check every guild directory in parallel"""
+    guild_dirs = sorted(
+        os.path.join(data_dir, entry)
+        for entry in os.listdir(data_dir)
+        if entry.startswith('guild_') and os.path.isdir(os.path.join(data_dir, entry))
+    )
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        guilds = list(executor.map(check_guild, guild_dirs, [repair] * len(guild_dirs), [codec] * len(guild_dirs)))
+
+    return {'top_level': check_top_level(data_dir), 'guilds': guilds}
+
+def print_report(report: Dict[str, Any]):
+    """Print a human readable report"""
+    for issue in report['top_level']:
+        print(f"[data] {issue}")
+
+    for guild in report['guilds']:
+        stats = guild['stats']
+        summary = (f"{stats['users']} users, {stats['total_balance']} points, "
+                   f"{stats['items']} items, {stats['pending']} pending ({stats['pending_value']} points)")
+        if not stats['setup_complete']:
+            summary += ", setup incomplete"
+        if stats['backups']:
+            summary += f", {stats['backups']} backup(s)"
+        print(f"\n{guild['guild']}: {summary}")
+        for issue in guild['issues']:
+            print(f"  - {issue}")
+        if guild['repaired']:
+            print(f"  repaired: {', '.join(guild['repaired'])}")
+        if guild['manual_recovery']:
+            print(f"  needs manual recovery, nothing in this guild was rewritten: {', '.join(guild['manual_recovery'])}")
+
+    total_issues = len(report['top_level']) + sum(len(g['issues']) for g in report['guilds'])
+    print(f"\nChecked {len(report['guilds'])} guild(s), found {total_issues} issue(s)")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check and repair the bot's data files")
+    parser.add_argument('--data-dir', default=Config.DATA_DIR, help="data directory to scan")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--repair', action='store_true', help="fix problems in place")
+    parser.add_argument('--codec', default=Config.STORAGE_CODEC, help="codec used when rewriting repaired files")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.data_dir):
+        print(f"Data directory {args.data_dir} not found")
+        return 2
+
+    report = run_checks(args.data_dir, args.repair, args.workers, args.codec)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    unrepaired = any((g['issues'] and not g['repaired']) or g['manual_recovery'] for g in report['guilds'])
+    return 1 if unrepaired else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
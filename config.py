@@ -21,12 +21,47 @@ class Config:
     # Points system settings
     DEFAULT_BALANCE = 0
     MAX_POINTS_PER_TRANSACTION = 10000
+    # Pending purchases older than this are denied and their stock released (0 disables)
+    PURCHASE_EXPIRY_HOURS = int(os.getenv("PURCHASE_EXPIRY_HOURS", "72"))
     
     # File paths
     DATA_DIR = "data"
     USERS_FILE = f"{DATA_DIR}/users.json"
     STOCK_FILE = f"{DATA_DIR}/stock.json"
     PENDING_FILE = f"{DATA_DIR}/pending_purchases.json"
+    COMMAND_SYNC_FILE = f"{DATA_DIR}/command_sync.json"
+    STATS_FILE = f"{DATA_DIR}/stats.json"
+    
+    # Data file encoding: "json" (plain pretty-printed JSON, no checksum), "compact"
+    # (checksummed compact JSON behind a header line, so not plain JSON) or "binary"
+    # (checksummed pickle protocol 4 behind the same header)
+    STORAGE_CODEC = os.getenv("STORAGE_CODEC", "json")
+    
+    # Command sync settings
+    # Set SYNC_GUILD_ID to sync commands to a single guild while developing
+    SYNC_GUILD_ID = int(os.getenv("SYNC_GUILD_ID", "0")) or None
+    FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "").lower() in ("1", "true", "yes")
+    
+    # Stats endpoint on the keep-alive server requires ?token=STATS_TOKEN and is disabled (403) when unset
+    STATS_TOKEN = os.getenv("STATS_TOKEN")
+    
+    # Rate limits per command as {scope: (burst size, tokens refilled per second)}
+    # "user" buckets are per user per guild, "guild" buckets are shared by the whole guild
+    RATE_LIMITS = {
+        "default": {"user": (5, 0.5), "guild": (60, 10)},
+        "buy": {"user": (3, 0.2), "guild": (30, 5)},
+        "balance": {"user": (5, 0.5), "guild": (60, 10)},
+        "autocomplete": {"user": (10, 2), "guild": (100, 25)},
+        "givepoints": {"user": (20, 2), "guild": (60, 10)},
+        "pending": {"user": (10, 1), "guild": (30, 5)},
+    }
+    # Per-guild overrides, e.g. {123456789012345678: {"buy": {"user": (1, 0.1)}}}
+    GUILD_RATE_LIMITS = {}
+    
+    # Member caching: "full" caches every member of every guild (needs the members intent),
+    # "lru" keeps only the USER_CACHE_SIZE most recently active users and fetches the rest on demand
+    MEMBER_CACHE_MODE = os.getenv("MEMBER_CACHE_MODE", "full").lower()
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1000"))
     
     @classmethod
     def validate(cls):
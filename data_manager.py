@@ -1,10 +1,29 @@
-import json
 import os
-from typing import Dict, Any
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+from config import Config
+from stats_counters import get_stats
+from storage_codec import CorruptFileError, read_file, write_file
+
+# One lock per guild. main.py runs every mutation in a worker thread, so a guild's
+# read-modify-write stays atomic while other guilds carry on during its fsyncs
+_guild_locks: Dict[Any, threading.RLock] = {}
+_guild_locks_guard = threading.Lock()
+
+def get_guild_lock(guild_id) -> threading.RLock:
+    """Get the lock guarding a guild's data files"""
+    with _guild_locks_guard:
+        if guild_id not in _guild_locks:
+            _guild_locks[guild_id] = threading.RLock()
+        return _guild_locks[guild_id]
 
 class DataManager:
-    def __init__(self, guild_id=None):
+    def __init__(self, guild_id=None, codec=None):
         self.guild_id = guild_id
+        self.codec = codec or Config.STORAGE_CODEC
+        self.lock = get_guild_lock(guild_id)
         if guild_id:
             self.data_dir = f"data/guild_{guild_id}"
             self.users_file = f"{self.data_dir}/users.json"
@@ -30,19 +49,16 @@ class DataManager:
         
         # Initialize users.json
         if not os.path.exists(self.users_file):
-            with open(self.users_file, 'w') as f:
-                json.dump({}, f, indent=2)
+            self._save_json(self.users_file, {})
         
         # Initialize stock.json with empty stock
         if not os.path.exists(self.stock_file):
             default_stock = {}  # Empty stock - add items using /addstock command
-            with open(self.stock_file, 'w') as f:
-                json.dump(default_stock, f, indent=2)
+            self._save_json(self.stock_file, default_stock)
         
         # Initialize pending_purchases.json
         if not os.path.exists(self.pending_file):
-            with open(self.pending_file, 'w') as f:
-                json.dump({}, f, indent=2)
+            self._save_json(self.pending_file, {})
         
         # Initialize guild config.json
         if not os.path.exists(self.config_file):
@@ -51,27 +67,30 @@ class DataManager:
                 "approval_role_id": None,
                 "setup_complete": False
             }
-            with open(self.config_file, 'w') as f:
-                json.dump(default_config, f, indent=2)
+            self._save_json(self.config_file, default_config)
     
     def _init_global_files(self):
         """Initialize global server configs file"""
         if not os.path.exists(self.config_file):
-            with open(self.config_file, 'w') as f:
-                json.dump({}, f, indent=2)
+            self._save_json(self.config_file, {})
     
     def _load_json(self, file_path: str) -> Dict[str, Any]:
-        """Load JSON data from file"""
+        """Load data from file in any supported format.
+        
+        A missing file reads as empty, but a corrupt one raises
+        CorruptFileError so the next save can't overwrite real data with {}.
+        """
         try:
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+            return read_file(file_path)
+        except FileNotFoundError:
             return {}
+        except CorruptFileError as e:
+            print(f"Refusing to use corrupt data file {file_path}: {e}. Run check_data.py to inspect it.")
+            raise
     
     def _save_json(self, file_path: str, data: Dict[str, Any]):
-        """Save JSON data to file"""
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        """Atomically save data to file with the configured codec"""
+        write_file(file_path, data, self.codec)
     
     def get_balance(self, user_id: int) -> int:
         """Get user's point balance"""
@@ -80,42 +99,50 @@ class DataManager:
     
     def add_points(self, user_id: int, amount: int) -> int:
         """Add points to user's balance and return new balance"""
-        users = self._load_json(self.users_file)
-        user_str = str(user_id)
-        
-        if user_str not in users:
-            users[user_str] = {'balance': 0}
-        
-        users[user_str]['balance'] += amount
-        self._save_json(self.users_file, users)
-        
-        return users[user_str]['balance']
+        with self.lock:
+            users = self._load_json(self.users_file)
+            user_str = str(user_id)
+            
+            if user_str not in users:
+                users[user_str] = {'balance': 0}
+            
+            users[user_str]['balance'] += amount
+            self._save_json(self.users_file, users)
+            get_stats().record_points_changed(amount)
+            
+            return users[user_str]['balance']
     
     def deduct_points(self, user_id: int, amount: int) -> int:
         """Deduct points from user's balance and return new balance"""
-        users = self._load_json(self.users_file)
-        user_str = str(user_id)
-        
-        if user_str not in users:
-            users[user_str] = {'balance': 0}
-        
-        users[user_str]['balance'] = max(0, users[user_str]['balance'] - amount)
-        self._save_json(self.users_file, users)
-        
-        return users[user_str]['balance']
+        with self.lock:
+            users = self._load_json(self.users_file)
+            user_str = str(user_id)
+            
+            if user_str not in users:
+                users[user_str] = {'balance': 0}
+            
+            old_balance = users[user_str]['balance']
+            users[user_str]['balance'] = max(0, old_balance - amount)
+            self._save_json(self.users_file, users)
+            get_stats().record_points_changed(users[user_str]['balance'] - old_balance)
+            
+            return users[user_str]['balance']
     
     def set_balance(self, user_id: int, amount: int) -> int:
         """Set user's balance to a specific amount and return new balance"""
-        users = self._load_json(self.users_file)
-        user_str = str(user_id)
-        
-        if user_str not in users:
-            users[user_str] = {'balance': 0}
-        
-        users[user_str]['balance'] = max(0, amount)
-        self._save_json(self.users_file, users)
-        
-        return users[user_str]['balance']
+        with self.lock:
+            users = self._load_json(self.users_file)
+            user_str = str(user_id)
+            
+            if user_str not in users:
+                users[user_str] = {'balance': 0}
+            
+            old_balance = users[user_str]['balance']
+            users[user_str]['balance'] = max(0, amount)
+            self._save_json(self.users_file, users)
+            get_stats().record_points_changed(users[user_str]['balance'] - old_balance)
+            
+            return users[user_str]['balance']
     
     def get_stock(self) -> Dict[str, Any]:
         """Get all stock items"""
@@ -123,59 +150,248 @@ class DataManager:
     
     def add_pending_purchase(self, user_id: int, item_name: str, cost: int):
         """Add a pending purchase"""
-        pending = self._load_json(self.pending_file)
-        user_str = str(user_id)
-        
-        if user_str not in pending:
-            pending[user_str] = []
-        
-        purchase = {
-            'item': item_name,
-            'cost': cost,
-            'timestamp': str(int(__import__('time').time()))
-        }
-        
-        pending[user_str].append(purchase)
-        self._save_json(self.pending_file, pending)
+        with self.lock:
+            pending = self._load_json(self.pending_file)
+            user_str = str(user_id)
+            
+            if user_str not in pending:
+                pending[user_str] = []
+            
+            purchase = {
+                'id': uuid.uuid4().hex,
+                'item': item_name,
+                'cost': cost,
+                'timestamp': str(int(__import__('time').time()))
+            }
+            
+            pending[user_str].append(purchase)
+            self._save_json(self.pending_file, pending)
+            get_stats().record_purchase_requested()
+            
+            return purchase['id']
     
     def remove_pending_purchase(self, user_id: int, item_name: str):
         """Remove a pending purchase"""
-        pending = self._load_json(self.pending_file)
-        user_str = str(user_id)
-        
-        if user_str in pending:
-            # Remove the first matching item
-            for i, purchase in enumerate(pending[user_str]):
-                if purchase['item'] == item_name:
-                    pending[user_str].pop(i)
-                    break
+        with self.lock:
+            pending = self._load_json(self.pending_file)
+            user_str = str(user_id)
             
-            # Remove user entry if no pending purchases
-            if not pending[user_str]:
-                del pending[user_str]
-            
-            self._save_json(self.pending_file, pending)
+            if user_str in pending:
+                # Remove the first matching item
+                for i, purchase in enumerate(pending[user_str]):
+                    if purchase['item'] == item_name:
+                        pending[user_str].pop(i)
+                        break
+                
+                # Remove user entry if no pending purchases
+                if not pending[user_str]:
+                    del pending[user_str]
+                
+                self._save_json(self.pending_file, pending)
     
     def get_pending_purchases(self, user_id: int) -> list:
         """Get all pending purchases for a user"""
         pending = self._load_json(self.pending_file)
         return pending.get(str(user_id), [])
     
-    def add_stock_item(self, item_name: str, cost: int, description: str = ""):
-        """Add an item to stock"""
-        stock = self._load_json(self.stock_file)
-        stock[item_name] = {
-            'cost': cost,
-            'description': description
-        }
-        self._save_json(self.stock_file, stock)
+    def get_all_pending_purchases(self, user_id: Optional[int] = None, item_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get every pending purchase in the guild, optionally filtered by user or item"""
+        with self.lock:
+            pending = self._load_json(self.pending_file)
+            
+            # Purchases created before ids existed get one assigned here
+            missing_ids = False
+            results = []
+            for user_str, purchases in pending.items():
+                for purchase in purchases:
+                    if 'id' not in purchase:
+                        purchase['id'] = uuid.uuid4().hex
+                        missing_ids = True
+                    
+                    if user_id is not None and user_str != str(user_id):
+                        continue
+                    if item_name is not None and purchase['item'].lower() != item_name.lower():
+                        continue
+                    
+                    results.append({**purchase, 'user_id': int(user_str)})
+            
+            if missing_ids:
+                self._save_json(self.pending_file, pending)
+            
+            results.sort(key=lambda p: int(p.get('timestamp', 0)))
+            return results
+    
+    def reserve_purchase(self, user_id: int, item_name: str) -> Dict[str, Any]:
+        """Atomically hold an item and the user's points while the purchase awaits approval.
+        
+        Returns a dict whose 'status' is one of 'reserved', 'not_found',
+        'sold_out', 'limit_reached' or 'insufficient_points'. A successful
+        reservation also carries 'purchase_id', 'balance_before' and
+        'balance_after'.
+        """
+        with self.lock:
+            stock = self._load_json(self.stock_file)
+            item = stock.get(item_name)
+            if item is None:
+                return {'status': 'not_found'}
+            
+            users = self._load_json(self.users_file)
+            pending = self._load_json(self.pending_file)
+            user_str = str(user_id)
+            user = users.setdefault(user_str, {'balance': 0})
+            
+            quantity = item.get('quantity')
+            if quantity is not None and quantity - item.get('reserved', 0) <= 0:
+                return {'status': 'sold_out'}
+            
+            per_user_limit = item.get('per_user_limit')
+            if per_user_limit is not None:
+                owned = user.get('purchases', {}).get(item_name, 0)
+                owned += sum(1 for p in pending.get(user_str, []) if p['item'] == item_name)
+                if owned >= per_user_limit:
+                    return {'status': 'limit_reached', 'limit': per_user_limit}
+            
+            balance_before = user['balance']
+            if balance_before < item['cost']:
+                return {'status': 'insufficient_points', 'balance': balance_before}
+            
+            # Points are held now and refunded if the purchase is released
+            user['balance'] -= item['cost']
+            
+            purchase = {
+                'id': uuid.uuid4().hex,
+                'item': item_name,
+                'cost': item['cost'],
+                'timestamp': str(int(time.time())),
+                'held': False
+            }
+            pending.setdefault(user_str, []).append(purchase)
+            
+            # Only limited items track reservations, unlimited stock is never rewritten
+            if quantity is not None:
+                item['reserved'] = item.get('reserved', 0) + 1
+                purchase['reserved'] = True
+            
+            # Ordered writes, not one transaction. The purchase is recorded before the points
+            # are taken, and only marked held once they have been, so a crash part way can leave
+            # a purchase with held=False (no refund on deny) but never refund points that were
+            # never deducted. check_data.py reports purchases stuck with held=False
+            self._save_json(self.pending_file, pending)
+            if quantity is not None:
+                self._save_json(self.stock_file, stock)
+            self._save_json(self.users_file, users)
+            purchase['held'] = True
+            self._save_json(self.pending_file, pending)
+            get_stats().record_purchase_requested()
+            
+            return {
+                'status': 'reserved',
+                'purchase_id': purchase['id'],
+                'balance_before': balance_before,
+                'balance_after': user['balance']
+            }
+    
+    def resolve_pending_purchases(self, purchase_ids: List[str], refund: bool = False) -> List[Dict[str, Any]]:
+        """Approve or deny several pending purchases at once.
+        
+        Approving commits any reserved stock; refunding releases it and
+        returns the points. Each file is written at most once. Returns the
+        purchases that were actually removed; ids that are no longer pending
+        are skipped.
+        """
+        wanted = set(purchase_ids)
+        with self.lock:
+            pending = self._load_json(self.pending_file)
+            resolved = []
+            
+            for user_str in list(pending.keys()):
+                kept = []
+                for purchase in pending[user_str]:
+                    if purchase.get('id') in wanted:
+                        resolved.append({**purchase, 'user_id': int(user_str)})
+                    else:
+                        kept.append(purchase)
+                
+                if kept:
+                    pending[user_str] = kept
+                else:
+                    del pending[user_str]
+            
+            if not resolved:
+                return []
+            
+            users = self._load_json(self.users_file)
+            stock = self._load_json(self.stock_file)
+            stock_changed = False
+            
+            for purchase in resolved:
+                user = users.setdefault(str(purchase['user_id']), {'balance': 0})
+                if refund:
+                    # Purchases made before points were held at buy time have nothing to refund
+                    if purchase.get('held'):
+                        user['balance'] += purchase['cost']
+                else:
+                    purchases = user.setdefault('purchases', {})
+                    purchases[purchase['item']] = purchases.get(purchase['item'], 0) + 1
+                
+                item = stock.get(purchase['item'])
+                if purchase.get('reserved') and item is not None:
+                    item['reserved'] = max(0, item.get('reserved', 0) - 1)
+                    if not refund and item.get('quantity') is not None:
+                        item['quantity'] = max(0, item['quantity'] - 1)
+                    stock_changed = True
+            
+            # These are ordered writes, not one atomic transaction. Pending goes first so a
+            # crash part way can at worst lose a refund, never pay one twice
+            self._save_json(self.pending_file, pending)
+            if stock_changed:
+                self._save_json(self.stock_file, stock)
+            self._save_json(self.users_file, users)
+            
+            stats = get_stats()
+            now = int(time.time())
+            for purchase in resolved:
+                if refund:
+                    stats.record_purchase_denied(purchase['cost'] if purchase.get('held') else 0)
+                else:
+                    stats.record_purchase_approved(purchase['item'], purchase['cost'], now - int(purchase.get('timestamp', now)))
+            return resolved
+    
+    def release_expired_purchases(self, max_age: int) -> List[Dict[str, Any]]:
+        """Deny and refund pending purchases older than max_age seconds"""
+        cutoff = int(time.time()) - max_age
+        with self.lock:
+            expired = [
+                p['id'] for p in self.get_all_pending_purchases()
+                if int(p.get('timestamp', 0)) < cutoff
+            ]
+            if not expired:
+                return []
+            return self.resolve_pending_purchases(expired, refund=True)
+    
+    def add_stock_item(self, item_name: str, cost: int, description: str = "", quantity: Optional[int] = None, per_user_limit: Optional[int] = None):
+        """Add an item to stock, optionally with limited quantity and a per-user limit"""
+        with self.lock:
+            stock = self._load_json(self.stock_file)
+            existing = stock.get(item_name, {})
+            stock[item_name] = {
+                'cost': cost,
+                'description': description,
+                'quantity': quantity,
+                'per_user_limit': per_user_limit
+            }
+            # Keep in-flight reservations when an item is restocked
+            if existing.get('reserved'):
+                stock[item_name]['reserved'] = existing['reserved']
+            self._save_json(self.stock_file, stock)
     
     def remove_stock_item(self, item_name: str):
         """Remove an item from stock"""
-        stock = self._load_json(self.stock_file)
-        if item_name in stock:
-            del stock[item_name]
-            self._save_json(self.stock_file, stock)
+        with self.lock:
+            stock = self._load_json(self.stock_file)
+            if item_name in stock:
+                del stock[item_name]
+                self._save_json(self.stock_file, stock)
     
     def get_user_stats(self, user_id: int) -> Dict[str, Any]:
         """Get comprehensive user statistics"""
@@ -196,11 +412,12 @@ class DataManager:
     
     def update_guild_config(self, config_updates: Dict[str, Any]):
         """Update guild configuration"""
-        if not self.guild_id:
-            return
-        config = self.get_guild_config()
-        config.update(config_updates)
-        self._save_json(self.config_file, config)
+        with self.lock:
+            if not self.guild_id:
+                return
+            config = self.get_guild_config()
+            config.update(config_updates)
+            self._save_json(self.config_file, config)
     
     def is_setup_complete(self) -> bool:
         """Check if guild setup is complete"""
@@ -1,15 +1,31 @@
-from flask import Flask
 from threading import Thread
 
-app = Flask('')
+def create_app():
+    # Flask is imported lazily so it loads off the bot's startup path
+    from flask import Flask, abort, jsonify, request
+    from config import Config
+    from rate_limit import get_rate_limiter
+    from stats_counters import get_stats
 
-@app.route('/')
-def home():
-    return "I'm alive!"
+    app = Flask('')
+
+    @app.route('/')
+    def home():
+        return "I'm alive!"
+
+    @app.route('/stats')
+    def stats():
+        # Totals span every server, so the endpoint stays closed until a token is configured
+        if not Config.STATS_TOKEN or request.args.get('token') != Config.STATS_TOKEN:
+            abort(403)
+        return jsonify({**get_stats().snapshot(), 'rate_limits': get_rate_limiter().snapshot()})
+
+    return app
 
 def run():
+    app = create_app()
     app.run(host='0.0.0.0', port=8080)
 
 def keep_alive():
     t = Thread(target=run)
-    t.start()
\ No newline at end of file
+    t.start()
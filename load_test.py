@@ -0,0 +1,417 @@
+"""End-to-end load test of the bot's command handlers without Discord.
+
+Stands in fake interactions, members, roles, guilds and channels for the
+real discord.py objects, then replays thousands of concurrent command and
+button-click sequences against the actual handlers in main.py across many
+synthetic guilds. Everything runs in a temporary data directory.
+
+Reports p50/p99 latency and throughput per operation, lost updates (final
+balances that don't match the ledger of successful operations) and stock
+consistency for limited items.
+
+    python load_test.py [--guilds 20] [--users 50] [--purchases 3] [--concurrency 500]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import discord
+
+class FakePermissions:
+    def __init__(self, administrator: bool = False):
+        self.administrator = administrator
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+        self.mention = f"<@&{role_id}>"
+
+class FakeMember:
+    def __init__(self, user_id: int, name: str, api_latency: float, roles: Optional[List[FakeRole]] = None,
+                 administrator: bool = False, dms_open: bool = True):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{user_id}>"
+        self.roles = roles or []
+        self.guild_permissions = FakePermissions(administrator)
+        self.display_avatar = SimpleNamespace(url=f"https://cdn.example/avatars/{user_id}.png")
+        self.dms_open = dms_open
+        self.api_latency = api_latency
+        self.dms: List[str] = []
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        if not self.dms_open:
+            raise discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Cannot send messages to this user")
+        self.dms.append(content)
+
+class FakeChannel:
+    def __init__(self, channel_id: int, api_latency: float):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+        self.api_latency = api_latency
+        self.messages: List[Dict[str, Any]] = []
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        message = {'content': content, **kwargs}
+        self.messages.append(message)
+        return SimpleNamespace(id=len(self.messages), **message)
+
+class FakeGuild:
+    def __init__(self, guild_id: int, name: str):
+        self.id = guild_id
+        self.name = name
+        self.members: Dict[int, FakeMember] = {}
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        return self.members.get(user_id)
+
+class FakeResponse:
+    """Records what a handler sent, mirroring discord.InteractionResponse"""
+    def __init__(self, api_latency: float):
+        self.api_latency = api_latency
+        self.done = False
+        self.messages: List[Dict[str, Any]] = []
+
+    def is_done(self) -> bool:
+        return self.done
+
+    async def _respond(self, kind: str, **kwargs):
+        if self.done:
+            raise discord.InteractionResponded(None)
+        await asyncio.sleep(self.api_latency)
+        self.done = True
+        self.messages.append({'kind': kind, **kwargs})
+
+    async def send_message(self, content: Optional[str] = None, **kwargs):
+        await self._respond('message', content=content, **kwargs)
+
+    async def edit_message(self, **kwargs):
+        await self._respond('edit', **kwargs)
+
+    async def defer(self, **kwargs):
+        await self._respond('defer', **kwargs)
+
+    async def autocomplete(self, choices):
+        await self._respond('autocomplete', choices=choices)
+
+class FakeFollowup:
+    def __init__(self, api_latency: float):
+        self.api_latency = api_latency
+        self.messages: List[Dict[str, Any]] = []
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        self.messages.append({'content': content, **kwargs})
+
+class FakeInteraction:
+    def __init__(self, user: FakeMember, guild: FakeGuild, channel: FakeChannel, command_name: str, api_latency: float,
+                 interaction_type: discord.InteractionType = discord.InteractionType.application_command):
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = channel
+        self.channel_id = channel.id
+        self.type = interaction_type
+        self.data = {'name': command_name}
+        self.response = FakeResponse(api_latency)
+        self.followup = FakeFollowup(api_latency)
+
+    def title(self) -> Optional[str]:
+        """Title of the first embed the handler responded with"""
+        for message in self.response.messages:
+            embed = message.get('embed')
+            if embed is not None:
+                return embed.title
+        return None
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.api_latency = args.api_latency / 1000
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.throttled = 0
+        self.errors: List[str] = []
+
+        self.guilds: Dict[int, FakeGuild] = {}
+        self.channels: Dict[int, FakeChannel] = {}
+        self.approval_channels: Dict[int, FakeChannel] = {}
+        self.staff: Dict[int, FakeMember] = {}
+        self.users: Dict[int, List[FakeMember]] = {}
+        self.initial_quantity: Dict[int, Dict[str, int]] = {}
+
+        # Ledger of what the handlers reported as successful
+        self.given = defaultdict(int)
+        self.purchases: Dict[str, Dict[str, Any]] = {}
+
+    def install_fakes(self, main):
+        """Point the bot's cache lookups at the fake objects"""
+        members = {}
+        for guild in self.guilds.values():
+            members.update(guild.members)
+
+        async def fetch_user(user_id):
+            await asyncio.sleep(self.api_latency)
+            return members[user_id]
+
+        # A cold cache forces every user lookup through the coalesced fetch path
+        main.bot.get_user = (lambda user_id: None) if self.args.cold_cache else members.get
+        if self.args.cold_cache:
+            # Otherwise /balance would warm the LRU and approvals would never miss
+            main.user_cache.max_size = 0
+            main.user_cache.clear()
+        main.bot.fetch_user = fetch_user
+        main.bot.get_channel = self.channels.get
+        main.bot.get_guild = self.guilds.get
+
+    def create_guilds(self, main):
+        """Create synthetic guilds, members, channels and stock"""
+        for g in range(self.args.guilds):
+            guild_id = 900000000000000000 + g
+            guild = FakeGuild(guild_id, f"Load Test Guild {g}")
+            channel = FakeChannel(800000000000000000 + g, self.api_latency)
+            staff_role = FakeRole(700000000000000000 + g, "staff")
+
+            staff = FakeMember(600000000000000000 + g, f"staff-{g}", self.api_latency, [staff_role])
+            guild.members[staff.id] = staff
+            self.staff[guild_id] = staff
+            self.users[guild_id] = []
+            for u in range(self.args.users):
+                member = FakeMember(100000000000000000 + g * 100000 + u, f"user-{g}-{u}", self.api_latency,
+                                    dms_open=self.rng.random() > 0.1)
+                guild.members[member.id] = member
+                self.users[guild_id].append(member)
+
+            self.guilds[guild_id] = guild
+            self.channels[channel.id] = channel
+            self.approval_channels[guild_id] = channel
+
+            guild_dm = main.get_data_manager(guild_id)
+            guild_dm.update_guild_config({
+                "approval_channel_id": channel.id,
+                "approval_role_id": staff_role.id,
+                "setup_complete": True
+            })
+            guild_dm.add_stock_item("Common Item", 50, "Unlimited")
+            guild_dm.add_stock_item("Rare Item", 200, "Unlimited")
+            limited = max(1, self.args.users // 5)
+            guild_dm.add_stock_item("Limited Drop", 100, "Oversell canary", quantity=limited, per_user_limit=1)
+            self.initial_quantity[guild_id] = {"Limited Drop": limited}
+
+    async def timed(self, op: str, interaction: FakeInteraction, call, slash_command: bool = True):
+        """Run one handler call, optionally through the rate limiter, and record its latency"""
+        async with self.semaphore:
+            start = time.perf_counter()
+            # Button clicks never pass through the command tree, so they are never rate limited
+            if self.args.rate_limit and slash_command and not await self.main.bot.tree.interaction_check(interaction):
+                self.throttled += 1
+                return False
+            try:
+                await call()
+            except Exception as e:
+                self.errors.append(f"{op}: {type(e).__name__}: {e}")
+                return False
+            finally:
+                self.latencies[op].append(time.perf_counter() - start)
+            return True
+
+    def interaction(self, user: FakeMember, guild_id: int, command_name: str, **kwargs) -> FakeInteraction:
+        return FakeInteraction(user, self.guilds[guild_id], self.approval_channels[guild_id], command_name, self.api_latency, **kwargs)
+
+    async def give_points(self, guild_id: int, user: FakeMember, amount: int):
+        interaction = self.interaction(self.staff[guild_id], guild_id, "givepoints")
+        if await self.timed('givepoints', interaction, lambda: self.main.give_points.callback(interaction, user, amount)):
+            if interaction.title() == "💰 Points Awarded":
+                self.given[(guild_id, user.id)] += amount
+
+    async def balance(self, guild_id: int, user: FakeMember):
+        interaction = self.interaction(user, guild_id, "balance")
+        await self.timed('balance', interaction, lambda: self.main.balance.callback(interaction, None))
+
+    async def autocomplete(self, guild_id: int, user: FakeMember):
+        interaction = self.interaction(user, guild_id, "buy", interaction_type=discord.InteractionType.autocomplete)
+        await self.timed('autocomplete', interaction, lambda: self.main.item_autocomplete(interaction, ""))
+
+    async def buy(self, guild_id: int, user: FakeMember, item_name: str):
+        interaction = self.interaction(user, guild_id, "buy")
+        await self.timed('buy', interaction, lambda: self.main.buy.callback(interaction, item_name))
+
+    async def click(self, guild_id: int, view, accept: bool):
+        """Click Accept or Deny on an approval message as the guild's staff member"""
+        interaction = self.interaction(self.staff[guild_id], guild_id, "approval")
+        button = view.accept_purchase if accept else view.deny_purchase
+        op = 'accept' if accept else 'deny'
+        if await self.timed(op, interaction, lambda: button.callback(interaction), slash_command=False):
+            if interaction.title() in ("✅ Purchase Approved", "❌ Purchase Denied"):
+                self.purchases[view.purchase_id]['outcome'] = op
+
+    async def user_session(self, guild_id: int, user: FakeMember):
+        await self.give_points(guild_id, user, self.rng.randint(100, 1000))
+        await self.balance(guild_id, user)
+        await self.autocomplete(guild_id, user)
+
+        # Fire the purchases at once, like a user hammering /buy at a drop
+        items = [self.rng.choice(["Common Item", "Rare Item", "Limited Drop"]) for _ in range(self.args.purchases)]
+        await asyncio.gather(*(self.buy(guild_id, user, item) for item in items))
+        await self.balance(guild_id, user)
+
+    async def staff_session(self, guild_id: int):
+        """Review every approval message in the guild, sometimes with a racing double click"""
+        clicks = []
+        for message in self.approval_channels[guild_id].messages:
+            view = message.get('view')
+            if view is None or view.purchase_id in self.purchases:
+                continue
+            self.purchases[view.purchase_id] = {
+                'guild_id': guild_id, 'user_id': view.user_id, 'item': view.item_name, 'cost': view.item_cost, 'outcome': None
+            }
+            accept = self.rng.random() < 0.7
+            if self.rng.random() < self.args.leave_pending:
+                continue
+            clicks.append(self.click(guild_id, view, accept))
+            if self.rng.random() < 0.1:
+                clicks.append(self.click(guild_id, view, self.rng.random() < 0.5))
+        await asyncio.gather(*clicks)
+
+    def verify(self, main) -> Dict[str, Any]:
+        """Compare final data files with the ledger of successful operations"""
+        lost_updates = []
+        stock_errors = []
+        double_processed = 0
+
+        for guild_id, members in self.users.items():
+            guild_dm = main.get_data_manager(guild_id)
+            pending_ids = {p['id'] for p in guild_dm.get_all_pending_purchases()}
+
+            guild_purchases = [p for pid, p in self.purchases.items() if p['guild_id'] == guild_id]
+            for member in members:
+                expected = self.given[(guild_id, member.id)]
+                for purchase in guild_purchases:
+                    if purchase['user_id'] == member.id and purchase['outcome'] != 'deny':
+                        expected -= purchase['cost']
+                actual = guild_dm.get_balance(member.id)
+                if actual != expected:
+                    lost_updates.append(f"guild {guild_id} user {member.id}: expected {expected}, found {actual}")
+
+            for pid, purchase in self.purchases.items():
+                if purchase['guild_id'] != guild_id:
+                    continue
+                if (purchase['outcome'] is None) != (pid in pending_ids):
+                    double_processed += 1
+
+            stock = guild_dm.get_stock()
+            for item_name, initial in self.initial_quantity[guild_id].items():
+                approved = sum(1 for p in guild_purchases if p['item'] == item_name and p['outcome'] == 'accept')
+                pending = sum(1 for p in guild_purchases if p['item'] == item_name and p['outcome'] is None)
+                item = stock[item_name]
+                if approved + pending > initial:
+                    stock_errors.append(f"guild {guild_id} {item_name}: oversold {approved + pending}/{initial}")
+                if item['quantity'] != initial - approved:
+                    stock_errors.append(f"guild {guild_id} {item_name}: quantity {item['quantity']}, expected {initial - approved}")
+                if item.get('reserved', 0) != pending:
+                    stock_errors.append(f"guild {guild_id} {item_name}: reserved {item.get('reserved', 0)}, expected {pending}")
+
+        return {'lost_updates': lost_updates, 'stock_errors': stock_errors, 'pending_mismatches': double_processed}
+
+    async def run(self, main) -> Dict[str, Any]:
+        self.main = main
+        self.create_guilds(main)
+        self.install_fakes(main)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            self.user_session(guild_id, member)
+            for guild_id, members in self.users.items()
+            for member in members
+        ))
+        await asyncio.gather(*(self.staff_session(guild_id) for guild_id in self.guilds))
+        elapsed = time.perf_counter() - start
+
+        return {'elapsed': elapsed, **self.verify(main)}
+
+def print_report(test: LoadTest, result: Dict[str, Any]):
+    total_ops = sum(len(samples) for samples in test.latencies.values())
+    print(f"\n{test.args.guilds} guilds x {test.args.users} users, {total_ops} operations in {result['elapsed']:.2f}s "
+          f"({total_ops / result['elapsed']:.0f} ops/s)")
+    print(f"  {'operation':<14} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for op, samples in sorted(test.latencies.items()):
+        print(f"  {op:<14} {len(samples):>7} {percentile(samples, 50) * 1000:>9.2f} "
+              f"{percentile(samples, 99) * 1000:>9.2f} {max(samples) * 1000:>9.2f}")
+
+    outcomes = defaultdict(int)
+    for purchase in test.purchases.values():
+        outcomes[purchase['outcome'] or 'pending'] += 1
+    print(f"\nPurchases: {dict(outcomes)}")
+    if test.args.rate_limit:
+        print(f"Throttled: {test.throttled}")
+    print(f"User cache: {test.main.user_cache.snapshot()}")
+
+    print(f"Handler errors: {len(test.errors)}")
+    for error in test.errors[:10]:
+        print(f"  - {error}")
+    print(f"Lost updates: {len(result['lost_updates'])}")
+    for issue in result['lost_updates'][:10]:
+        print(f"  - {issue}")
+    print(f"Stock inconsistencies: {len(result['stock_errors'])}")
+    for issue in result['stock_errors'][:10]:
+        print(f"  - {issue}")
+    print(f"Pending queue mismatches: {result['pending_mismatches']}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test main.py's handlers with fake Discord objects")
+    parser.add_argument('--guilds', type=int, default=20, help="number of synthetic guilds")
+    parser.add_argument('--users', type=int, default=50, help="users per guild")
+    parser.add_argument('--purchases', type=int, default=3, help="concurrent /buy calls per user")
+    parser.add_argument('--concurrency', type=int, default=500, help="maximum handler calls in flight")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="simulated Discord API latency in ms")
+    parser.add_argument('--leave-pending', type=float, default=0.1, help="fraction of purchases staff never review")
+    parser.add_argument('--rate-limit', action='store_true', help="send calls through the command tree's rate limiter")
+    parser.add_argument('--cold-cache', action='store_true', help="make every user lookup miss the client cache")
+    parser.add_argument('--keep-data', action='store_true', help="keep the temporary data directory")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-") if args.keep_data else None
+    with contextlib.ExitStack() as stack:
+        if workdir is None:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix="loadtest-"))
+        original_cwd = os.getcwd()
+        # DataManager uses paths relative to the working directory
+        os.chdir(workdir)
+        stack.callback(os.chdir, original_cwd)
+
+        import main as bot_main
+        # Write the counters while the temp directory still exists, so the flush at exit has nothing left to do
+        stack.callback(bot_main.get_stats().flush)
+
+        test = LoadTest(args)
+        # Handlers log every action; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = asyncio.run(test.run(bot_main))
+
+    print_report(test, result)
+    if args.keep_data:
+        print(f"\nData kept in {workdir}")
+    return 1 if result['lost_updates'] or result['stock_errors'] or result['pending_mismatches'] or test.errors else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,27 +1,56 @@
-from keep_alive import keep_alive
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import asyncio
+import hashlib
 import json
 import os
 from datetime import datetime
 from data_manager import DataManager
 from config import Config
+from stats_counters import get_stats
+from rate_limit import get_rate_limiter
+from user_cache import UserCache
 
 # Bot setup
 intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
-intents.members = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+if Config.MEMBER_CACHE_MODE == "lru":
+    # Skip caching every member of every guild; recently active users live in user_cache instead
+    intents.members = False
+    member_cache_options = {'member_cache_flags': discord.MemberCacheFlags.none(), 'chunk_guilds_at_startup': False}
+else:
+    intents.members = True
+    member_cache_options = {}
+
+class RateLimitedCommandTree(discord.app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """Reject spammy commands and autocomplete before any data is loaded"""
+        if interaction.type is discord.InteractionType.autocomplete:
+            command_name = "autocomplete"
+        else:
+            command_name = interaction.data.get('name', 'unknown') if interaction.data else 'unknown'
+        
+        retry_after = get_rate_limiter().check(command_name, interaction.guild_id, interaction.user.id)
+        if not retry_after:
+            return True
+        
+        if interaction.type is discord.InteractionType.autocomplete:
+            await interaction.response.autocomplete([])
+        else:
+            await interaction.response.send_message(f"⏳ Slow down! Try again in {max(1, round(retry_after))}s.", ephemeral=True)
+        return False
+
+bot = commands.Bot(command_prefix='!', intents=intents, tree_cls=RateLimitedCommandTree, **member_cache_options)
+user_cache = UserCache(bot, Config.USER_CACHE_SIZE)
 
 def get_data_manager(guild_id):
     """Get guild-specific data manager"""
     return DataManager(guild_id)
 
 class PurchaseApprovalView(discord.ui.View):
-    def __init__(self, user_id, item_name, item_cost, balance_before, balance_after, guild_id):
+    def __init__(self, user_id, item_name, item_cost, balance_before, balance_after, guild_id, purchase_id=None):
         super().__init__(timeout=300)  # 5 minute timeout
         self.user_id = user_id
         self.item_name = item_name
@@ -29,6 +58,7 @@ class PurchaseApprovalView(discord.ui.View):
         self.balance_before = balance_before
         self.balance_after = balance_after
         self.guild_id = guild_id
+        self.purchase_id = purchase_id
     
     @discord.ui.button(label='Accept', style=discord.ButtonStyle.green, emoji='✅')
     async def accept_purchase(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -44,14 +74,19 @@ class PurchaseApprovalView(discord.ui.View):
         
         try:
             # Get the user who made the purchase
-            user = bot.get_user(self.user_id)
+            user = await user_cache.fetch(self.user_id)
             if user is None:
                 await interaction.response.send_message("Could not find the user who made this purchase.", ephemeral=True)
                 return
             
             # Remove from pending purchases
             guild_dm = get_data_manager(interaction.guild_id)
-            guild_dm.remove_pending_purchase(self.user_id, self.item_name)
+            if self.purchase_id:
+                if not await asyncio.to_thread(guild_dm.resolve_pending_purchases, [self.purchase_id]):
+                    await interaction.response.send_message("This purchase has already been processed.", ephemeral=True)
+                    return
+            else:
+                await asyncio.to_thread(guild_dm.remove_pending_purchase, self.user_id, self.item_name)
             
             # Send DM to user
             try:
@@ -100,15 +135,20 @@ class PurchaseApprovalView(discord.ui.View):
         
         try:
             # Get the user who made the purchase
-            user = bot.get_user(self.user_id)
+            user = await user_cache.fetch(self.user_id)
             if user is None:
                 await interaction.response.send_message("Could not find the user who made this purchase.", ephemeral=True)
                 return
             
             # Refund points and remove from pending
             guild_dm = get_data_manager(self.guild_id)
-            guild_dm.add_points(self.user_id, self.item_cost)
-            guild_dm.remove_pending_purchase(self.user_id, self.item_name)
+            if self.purchase_id:
+                if not await asyncio.to_thread(guild_dm.resolve_pending_purchases, [self.purchase_id], refund=True):
+                    await interaction.response.send_message("This purchase has already been processed.", ephemeral=True)
+                    return
+            else:
+                await asyncio.to_thread(guild_dm.add_points, self.user_id, self.item_cost)
+                await asyncio.to_thread(guild_dm.remove_pending_purchase, self.user_id, self.item_name)
             
             # Send DM to user
             try:
@@ -143,15 +183,270 @@ class PurchaseApprovalView(discord.ui.View):
             except:
                 print(f"Failed to send error message: {str(e)}")
 
+async def notify_purchase_results(resolved, approved, channel=None, expired=False):
+    """Send one DM per user summarising their resolved purchases"""
+    by_user = {}
+    for purchase in resolved:
+        by_user.setdefault(purchase['user_id'], []).append(purchase)
+    
+    async def notify(user_id, purchases):
+        try:
+            user = await user_cache.fetch(user_id)
+        except discord.HTTPException:
+            return user_id
+        if user is None:
+            return user_id
+        
+        items = "\n".join(f"• **{p['item']}** ({p['cost']} points)" for p in purchases)
+        if approved:
+            message = f"✅ **Purchase Approved!**\n\nSuccessfully bought:\n{items}\n\nGive the staff a few hours to give you your items in game."
+        else:
+            title = "⌛ **Purchase Expired**" if expired else "❌ **Purchase Denied**"
+            reason = "expired before staff could review them" if expired else "were denied"
+            message = f"{title}\n\nThe following purchases {reason}:\n{items}"
+            refund = sum(p['cost'] for p in purchases if p.get('held'))
+            if refund:
+                message += f"\n\n**{refund} points** have been refunded to your account."
+        
+        try:
+            await user.send(message)
+        except discord.HTTPException:
+            return user_id
+        return None
+    
+    results = await asyncio.gather(*(notify(uid, purchases) for uid, purchases in by_user.items()))
+    failed = [uid for uid in results if uid is not None]
+    
+    # Users with closed DMs get a single combined mention instead
+    if failed and channel:
+        mentions = " ".join(f"<@{uid}>" for uid in failed)
+        status = "approved" if approved else "denied and refunded"
+        try:
+            await channel.send(f"{mentions} your pending purchases were {status}. Could not send DM, so notifying here.")
+        except discord.HTTPException:
+            print(f"Failed to notify users {failed} about {status} purchases")
+
+class PendingQueueView(discord.ui.View):
+    PAGE_SIZE = 25  # Discord's select menu limit
+    
+    def __init__(self, guild_id, staff_id, user_filter=None, item_filter=None):
+        super().__init__(timeout=600)
+        self.guild_id = guild_id
+        self.staff_id = staff_id
+        self.user_filter = user_filter
+        self.item_filter = item_filter
+        self.page = 0
+        self.purchases = []
+        self.selected_ids = []
+        
+        self.purchase_select = discord.ui.Select(placeholder="Select purchases to approve or deny", min_values=1, row=0)
+        self.purchase_select.callback = self.select_purchases
+        self.add_item(self.purchase_select)
+    
+    async def refresh(self):
+        """Reload the queue and rebuild the select menu for the current page"""
+        guild_dm = get_data_manager(self.guild_id)
+        self.purchases = await asyncio.to_thread(guild_dm.get_all_pending_purchases, self.user_filter, self.item_filter)
+        page_count = max(1, (len(self.purchases) + self.PAGE_SIZE - 1) // self.PAGE_SIZE)
+        self.page = min(self.page, page_count - 1)
+        self.selected_ids = []
+        
+        guild = bot.get_guild(self.guild_id)
+        options = []
+        for purchase in self.page_purchases():
+            member = (guild.get_member(purchase['user_id']) if guild else None) or user_cache.get(purchase['user_id'])
+            buyer = member.display_name if member else f"User {purchase['user_id']}"
+            options.append(discord.SelectOption(
+                label=f"{purchase['item']} - {purchase['cost']} points"[:100],
+                description=f"{buyer} • {datetime.fromtimestamp(int(purchase['timestamp'])):%Y-%m-%d %H:%M}"[:100],
+                value=purchase['id']
+            ))
+        
+        if options:
+            self.purchase_select.options = options
+            self.purchase_select.max_values = len(options)
+            self.purchase_select.disabled = False
+        else:
+            self.purchase_select.options = [discord.SelectOption(label="No pending purchases", value="none")]
+            self.purchase_select.max_values = 1
+            self.purchase_select.disabled = True
+        
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= page_count - 1
+        self.approve_selected.disabled = True
+        self.deny_selected.disabled = True
+    
+    def page_purchases(self):
+        start = self.page * self.PAGE_SIZE
+        return self.purchases[start:start + self.PAGE_SIZE]
+    
+    def build_embed(self):
+        page_count = max(1, (len(self.purchases) + self.PAGE_SIZE - 1) // self.PAGE_SIZE)
+        filters = []
+        if self.user_filter:
+            filters.append(f"user <@{self.user_filter}>")
+        if self.item_filter:
+            filters.append(f"item **{self.item_filter}**")
+        
+        description = f"**{len(self.purchases)}** purchase(s) awaiting approval"
+        if filters:
+            description += f" for {' and '.join(filters)}"
+        if self.selected_ids:
+            description += f"\n\n**Selected:** {len(self.selected_ids)} purchase(s)"
+        
+        embed = discord.Embed(
+            title="🧾 Pending Purchases",
+            description=description,
+            color=0xffa500,
+            timestamp=datetime.now()
+        )
+        embed.set_footer(text=f"Page {self.page + 1}/{page_count}")
+        return embed
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.staff_id:
+            await interaction.response.send_message("Only the staff member who opened this queue can use it.", ephemeral=True)
+            return False
+        return True
+    
+    async def select_purchases(self, interaction: discord.Interaction):
+        self.selected_ids = list(self.purchase_select.values)
+        self.approve_selected.disabled = not self.selected_ids
+        self.deny_selected.disabled = not self.selected_ids
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+    
+    async def resolve_selected(self, interaction: discord.Interaction, approved: bool):
+        guild_dm = get_data_manager(self.guild_id)
+        resolved = await asyncio.to_thread(guild_dm.resolve_pending_purchases, self.selected_ids, refund=not approved)
+        
+        await self.refresh()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+        
+        action = "Approved" if approved else "Denied"
+        await interaction.followup.send(f"{'✅' if approved else '❌'} {action} {len(resolved)} purchase(s).", ephemeral=True)
+        print(f"Bulk purchase {action.lower()}: {interaction.user.display_name} {action.lower()} {len(resolved)} purchase(s) in guild {self.guild_id}")
+        
+        if resolved:
+            await notify_purchase_results(resolved, approved, interaction.channel)
+    
+    @discord.ui.button(label='Previous', style=discord.ButtonStyle.grey, row=1)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await self.refresh()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+    
+    @discord.ui.button(label='Next', style=discord.ButtonStyle.grey, row=1)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await self.refresh()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+    
+    @discord.ui.button(label='Approve Selected', style=discord.ButtonStyle.green, emoji='✅', row=2)
+    async def approve_selected(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.resolve_selected(interaction, approved=True)
+    
+    @discord.ui.button(label='Deny Selected', style=discord.ButtonStyle.red, emoji='❌', row=2)
+    async def deny_selected(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.resolve_selected(interaction, approved=False)
+
+def get_command_tree_hash(guild=None):
+    """Compute a stable hash of the registered app-command tree"""
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands(guild=guild)]
+    payload.sort(key=lambda command: command['name'])
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+def load_command_sync_state():
+    """Load the last synced command tree hashes"""
+    try:
+        with open(Config.COMMAND_SYNC_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_command_sync_state(state):
+    """Save the last synced command tree hashes"""
+    os.makedirs(Config.DATA_DIR, exist_ok=True)
+    with open(Config.COMMAND_SYNC_FILE, 'w') as f:
+        json.dump(state, f, indent=2)
+
+async def sync_command_tree():
+    """Sync slash commands only when the command tree has changed"""
+    guild = discord.Object(id=Config.SYNC_GUILD_ID) if Config.SYNC_GUILD_ID else None
+    scope = str(Config.SYNC_GUILD_ID) if guild else "global"
+    
+    if guild:
+        # Development mode: guild commands update instantly and have looser limits
+        bot.tree.copy_global_to(guild=guild)
+    
+    tree_hash = get_command_tree_hash(guild)
+    state = load_command_sync_state()
+    if state.get(scope) == tree_hash and not Config.FORCE_COMMAND_SYNC:
+        print(f"Command tree unchanged ({scope}), skipping sync")
+        return
+    
+    synced = await bot.tree.sync(guild=guild)
+    state[scope] = tree_hash
+    save_command_sync_state(state)
+    print(f"Synced {len(synced)} command(s) ({scope})")
+
+@bot.event
+async def on_interaction(interaction: discord.Interaction):
+    # Keep recently active users (and anyone they look up) around for approvals and DMs
+    user_cache.remember(interaction.user)
+
+@tasks.loop(minutes=10)
+async def release_expired_purchases():
+    """Deny and refund purchases nobody reviewed in time, freeing their reserved stock"""
+    max_age = Config.PURCHASE_EXPIRY_HOURS * 3600
+    for guild in bot.guilds:
+        # Skip guilds that never used the bot instead of creating data for them
+        if not os.path.isdir(os.path.join(Config.DATA_DIR, f"guild_{guild.id}")):
+            continue
+        
+        # One guild's corrupt file must not stop the sweep, or the loop, for every other guild
+        try:
+            guild_dm = get_data_manager(guild.id)
+            expired = await asyncio.to_thread(guild_dm.release_expired_purchases, max_age)
+            if expired:
+                print(f"Released {len(expired)} expired purchase(s) in guild {guild.name} ({guild.id})")
+                await notify_purchase_results(expired, approved=False, expired=True)
+        except Exception as e:
+            print(f"Failed to release expired purchases in guild {guild.name} ({guild.id}): {e}")
+
+@tasks.loop(minutes=1)
+async def flush_stats():
+    """Persist the stats counters even when the bot is idle"""
+    try:
+        await asyncio.to_thread(get_stats().flush)
+    except Exception as e:
+        # Keep the loop alive; the counters stay dirty and the next run retries
+        print(f"Failed to flush stats: {e}")
+
+commands_synced = False
+
 @bot.event
 async def on_ready():
+    global commands_synced
     print(f'{bot.user} has connected to Discord!')
     print(f'Bot is ready and serving {len(bot.guilds)} guilds.')
     
+    # Load (or on first run build) the stats counters before any handler records into them
+    await asyncio.to_thread(get_stats)
+    
+    if Config.PURCHASE_EXPIRY_HOURS > 0 and not release_expired_purchases.is_running():
+        release_expired_purchases.start()
+    if not flush_stats.is_running():
+        flush_stats.start()
+    
+    # on_ready fires again on every reconnect, only sync once per process
+    if commands_synced:
+        return
+    
     # Sync slash commands
     try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} command(s)")
+        await sync_command_tree()
+        commands_synced = True
     except Exception as e:
         print(f"Failed to sync commands: {e}")
 
@@ -171,7 +466,7 @@ async def setup(interaction: discord.Interaction, approval_channel: discord.Text
         "approval_role_id": approval_role.id if approval_role else None,
         "setup_complete": True
     }
-    guild_dm.update_guild_config(config_updates)
+    await asyncio.to_thread(guild_dm.update_guild_config, config_updates)
     
     embed = discord.Embed(
         title="✅ Setup Complete!",
@@ -210,7 +505,7 @@ async def give_points(interaction: discord.Interaction, user: discord.Member, am
         return
     
     # Add points to user
-    new_balance = guild_dm.add_points(user.id, amount)
+    new_balance = await asyncio.to_thread(guild_dm.add_points, user.id, amount)
     
     embed = discord.Embed(
         title="💰 Points Awarded",
@@ -234,6 +529,7 @@ async def balance(interaction: discord.Interaction, user: discord.Member = None)
         return
     
     target_user = user if user else interaction.user
+    user_cache.remember(target_user)
     balance = guild_dm.get_balance(target_user.id)
     
     embed = discord.Embed(
@@ -273,9 +569,15 @@ async def stock(interaction: discord.Interaction):
     )
     
     for item_name, item_data in stock_items.items():
+        value = f"**Price:** {item_data['cost']} points\n**Description:** {item_data.get('description', 'No description available')}"
+        if item_data.get('quantity') is not None:
+            available = max(0, item_data['quantity'] - item_data.get('reserved', 0))
+            value += f"\n**Available:** {available}" if available else "\n**Available:** Sold out"
+        if item_data.get('per_user_limit') is not None:
+            value += f"\n**Limit:** {item_data['per_user_limit']} per user"
         embed.add_field(
             name=f"💎 {item_name}",
-            value=f"**Price:** {item_data['cost']} points\n**Description:** {item_data.get('description', 'No description available')}",
+            value=value,
             inline=False
         )
     
@@ -309,7 +611,6 @@ async def buy(interaction: discord.Interaction, item_name: str):
         return
     
     stock_items = guild_dm.get_stock()
-    user_balance = guild_dm.get_balance(interaction.user.id)
     
     # Find the item (case-insensitive)
     item_key = None
@@ -330,8 +631,11 @@ async def buy(interaction: discord.Interaction, item_name: str):
     item_data = stock_items[item_key]
     item_cost = item_data['cost']
     
-    # Check if user has enough points
-    if user_balance < item_cost:
+    # Reserve stock and hold the points until staff approve or deny
+    reservation = await asyncio.to_thread(guild_dm.reserve_purchase, interaction.user.id, item_key)
+    
+    if reservation['status'] == 'insufficient_points':
+        user_balance = reservation['balance']
         embed = discord.Embed(
             title="❌ Insufficient Points",
             description=f"You need **{item_cost} points** to buy **{item_key}**.\n\n**Your balance:** {user_balance} points\n**Needed:** {item_cost - user_balance} more points",
@@ -340,9 +644,31 @@ async def buy(interaction: discord.Interaction, item_name: str):
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
     
-    # Add to pending (don't deduct points until approved)
-    balance_before = user_balance
-    guild_dm.add_pending_purchase(interaction.user.id, item_key, item_cost)
+    if reservation['status'] == 'sold_out':
+        embed = discord.Embed(
+            title="❌ Sold Out",
+            description=f"**{item_key}** is sold out.\n\nUse `/stock` to see available items.",
+            color=0xe74c3c
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    if reservation['status'] == 'limit_reached':
+        embed = discord.Embed(
+            title="❌ Purchase Limit Reached",
+            description=f"You can only buy **{item_key}** {reservation['limit']} time(s).",
+            color=0xe74c3c
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    if reservation['status'] != 'reserved':
+        await interaction.response.send_message(f"❌ Item '**{item_key}**' is no longer available.", ephemeral=True)
+        return
+    
+    purchase_id = reservation['purchase_id']
+    balance_before = reservation['balance_before']
+    balance_after = reservation['balance_after']
     
     # Send success message to user
     embed = discord.Embed(
@@ -373,7 +699,7 @@ async def buy(interaction: discord.Interaction, item_name: str):
         approval_embed.set_thumbnail(url=interaction.user.display_avatar.url)
         approval_embed.set_footer(text=f"User ID: {interaction.user.id}")
         
-        view = PurchaseApprovalView(interaction.user.id, item_key, item_cost, balance_before, balance_after, interaction.guild_id)
+        view = PurchaseApprovalView(interaction.user.id, item_key, item_cost, balance_before, balance_after, interaction.guild_id, purchase_id)
         
         await approval_channel.send(
             content=f"{approval_ping}",
@@ -384,7 +710,7 @@ async def buy(interaction: discord.Interaction, item_name: str):
         print(f"Warning: Approval channel {approval_channel_id} not found!")
 
 @bot.tree.command(name="addstock", description="Add an item to the shop (Staff only)")
-async def add_stock(interaction: discord.Interaction, item_name: str, cost: int, description: str = ""):
+async def add_stock(interaction: discord.Interaction, item_name: str, cost: int, description: str = "", quantity: int = None, per_user_limit: int = None):
     # Get guild data manager
     guild_dm = get_data_manager(interaction.guild_id)
     if not guild_dm.is_setup_complete():
@@ -405,12 +731,26 @@ async def add_stock(interaction: discord.Interaction, item_name: str, cost: int,
         await interaction.response.send_message("❌ Item cost must be greater than 0.", ephemeral=True)
         return
     
+    if quantity is not None and quantity < 0:
+        await interaction.response.send_message("❌ Quantity cannot be negative.", ephemeral=True)
+        return
+    
+    if per_user_limit is not None and per_user_limit <= 0:
+        await interaction.response.send_message("❌ Per-user limit must be greater than 0.", ephemeral=True)
+        return
+    
     # Add item to stock
-    guild_dm.add_stock_item(item_name, cost, description)
+    await asyncio.to_thread(guild_dm.add_stock_item, item_name, cost, description, quantity, per_user_limit)
+    
+    description_text = f"Successfully added **{item_name}** to the shop!\n\n**Price:** {cost} points\n**Description:** {description if description else 'No description provided'}"
+    if quantity is not None:
+        description_text += f"\n**Quantity:** {quantity}"
+    if per_user_limit is not None:
+        description_text += f"\n**Limit:** {per_user_limit} per user"
     
     embed = discord.Embed(
         title="✅ Stock Item Added",
-        description=f"Successfully added **{item_name}** to the shop!\n\n**Price:** {cost} points\n**Description:** {description if description else 'No description provided'}",
+        description=description_text,
         color=0x00ff00,
         timestamp=datetime.now()
     )
@@ -451,7 +791,7 @@ async def remove_stock(interaction: discord.Interaction, item_name: str):
         return
     
     # Remove item from stock
-    guild_dm.remove_stock_item(item_key)
+    await asyncio.to_thread(guild_dm.remove_stock_item, item_key)
     
     embed = discord.Embed(
         title="✅ Stock Item Removed",
@@ -488,7 +828,7 @@ async def set_balance(interaction: discord.Interaction, user: discord.Member, am
     
     # Set user balance
     old_balance = guild_dm.get_balance(user.id)
-    guild_dm.set_balance(user.id, amount)
+    await asyncio.to_thread(guild_dm.set_balance, user.id, amount)
     
     embed = discord.Embed(
         title="💰 Balance Updated",
@@ -501,6 +841,99 @@ async def set_balance(interaction: discord.Interaction, user: discord.Member, am
     await interaction.response.send_message(embed=embed)
     print(f"Balance set: {interaction.user.display_name} set {user.display_name}'s balance to {amount} points")
 
+@bot.tree.command(name="pending", description="Review and bulk approve pending purchases (Staff only)")
+@discord.app_commands.autocomplete(item_name=item_autocomplete)
+async def pending(interaction: discord.Interaction, user: discord.Member = None, item_name: str = None):
+    # Get guild data manager
+    guild_dm = get_data_manager(interaction.guild_id)
+    if not guild_dm.is_setup_complete():
+        await interaction.response.send_message("❌ Bot setup not complete. Use `/setup` command first.", ephemeral=True)
+        return
+    
+    # Check if user has staff permissions
+    has_permission = (
+        interaction.user.guild_permissions.administrator or
+        any(role.name.lower() in Config.STAFF_ROLES for role in interaction.user.roles) or
+        any(role.id == Config.SPECIAL_ROLE_ID for role in interaction.user.roles if Config.SPECIAL_ROLE_ID)
+    )
+    if not has_permission:
+        await interaction.response.send_message("❌ You don't have permission to review purchases. Only staff members can use this command.", ephemeral=True)
+        return
+    
+    view = PendingQueueView(interaction.guild_id, interaction.user.id, user.id if user else None, item_name)
+    await view.refresh()
+    await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
+
+def format_duration(seconds):
+    """Format a number of seconds as a short human readable duration"""
+    if seconds is None:
+        return "n/a"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+
+@bot.tree.command(name="stats", description="Show statistics across all servers (Bot owner only)")
+async def stats(interaction: discord.Interaction, rebuild: bool = False):
+    # Totals span every server, so only the bot owner may see them
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("❌ Only the bot owner can view global statistics.", ephemeral=True)
+        return
+    
+    if rebuild:
+        await interaction.response.defer(ephemeral=True)
+        totals = await asyncio.to_thread(get_stats().rebuild)
+    else:
+        totals = get_stats().snapshot()
+    
+    latency = totals['approval_latency']
+    top_items = sorted(totals['purchases_by_item'].items(), key=lambda entry: entry[1], reverse=True)[:10]
+    
+    embed = discord.Embed(
+        title="📊 Global Statistics",
+        description=f"Across **{len(bot.guilds)}** servers",
+        color=0x3498db,
+        timestamp=datetime.now()
+    )
+    embed.add_field(
+        name="💰 Points",
+        value=f"**Issued:** {totals['points_issued']}\n**Revoked:** {totals['points_revoked']}\n**Spent:** {totals['points_spent']}\n**Refunded:** {totals['points_refunded']}",
+        inline=True
+    )
+    embed.add_field(
+        name="🛒 Purchases",
+        value=f"**Requested:** {totals['purchases_requested']}\n**Approved:** {totals['purchases_approved']}\n**Denied:** {totals['purchases_denied']}\n**Pending:** {totals['pending_purchases']}",
+        inline=True
+    )
+    embed.add_field(
+        name="⏱️ Approval Latency",
+        value=f"**Average:** {format_duration(latency['average_seconds'])}\n**Max:** {format_duration(latency['max_seconds'] if latency['count'] else None)}\n**Samples:** {latency['count']}",
+        inline=True
+    )
+    embed.add_field(
+        name="💎 Top Items",
+        value="\n".join(f"**{name}:** {count}" for name, count in top_items) if top_items else "No purchases yet",
+        inline=False
+    )
+    
+    throttled = get_rate_limiter().snapshot()['throttled']
+    if throttled:
+        embed.add_field(
+            name="⏳ Rate Limited",
+            value="\n".join(f"**/{command}:** {sum(scopes.values())}" for command, scopes in sorted(throttled.items())),
+            inline=False
+        )
+    
+    since = totals['rebuilt_at'] or totals['since']
+    embed.set_footer(text=f"{'Rebuilt' if totals['rebuilt_at'] else 'Counting'} since {datetime.fromtimestamp(since):%Y-%m-%d %H:%M}")
+    
+    if rebuild:
+        await interaction.followup.send(embed=embed, ephemeral=True)
+    else:
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @bot.tree.command(name="help", description="Show bot commands and usage")
 async def help_command(interaction: discord.Interaction):
     embed = discord.Embed(
@@ -525,7 +958,7 @@ async def help_command(interaction: discord.Interaction):
     if has_staff_permission:
         embed.add_field(
             name="🔧 Staff Commands",
-            value="`/givepoints @user <amount>` - Give points to a user\n`/setbalance @user <amount>` - Set a user's balance\n`/addstock <name> <cost> [description]` - Add item to shop\n`/removestock <name>` - Remove item from shop",
+            value="`/givepoints @user <amount>` - Give points to a user\n`/setbalance @user <amount>` - Set a user's balance\n`/addstock <name> <cost> [description] [quantity] [per_user_limit]` - Add item to shop\n`/removestock <name>` - Remove item from shop\n`/pending [@user] [item]` - Bulk approve or deny pending purchases",
             inline=False
         )
     
@@ -577,5 +1010,7 @@ if __name__ == "__main__":
     if not token:
         print("Error: DISCORD_BOT_TOKEN environment variable not set!")
         exit(1)
+    # Imported here so the web server never delays reaching the gateway
+    from keep_alive import keep_alive
     keep_alive()
     bot.run(token)
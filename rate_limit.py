@@ -0,0 +1,115 @@
+"""Token-bucket rate limiting for slash commands and autocomplete.
+
+Every interaction is checked against a per-user and a per-guild bucket for
+its command before any data is touched, so spam is rejected without disk
+I/O. Limits come from Config.RATE_LIMITS with optional per-guild overrides
+in Config.GUILD_RATE_LIMITS.
+"""
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from config import Config
+
+class TokenBucket:
+    __slots__ = ('capacity', 'refill_rate', 'tokens', 'updated')
+
+    def __init__(self, capacity: float, refill_rate: float, now: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    def retry_after(self) -> float:
+        """Seconds until one token is available"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.refill_rate if self.refill_rate else float('inf')
+
+class RateLimiter:
+    # Buckets that have refilled completely are dropped once the table grows past this,
+    # at most once per PRUNE_INTERVAL seconds so a large table isn't walked on every call
+    PRUNE_THRESHOLD = 10000
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, limits: Dict[str, Dict[str, Tuple[float, float]]], guild_limits: Optional[Dict[int, Dict[str, Dict[str, Tuple[float, float]]]]] = None):
+        self.limits = limits
+        self.guild_limits = guild_limits or {}
+        self.buckets: Dict[Tuple, TokenBucket] = {}
+        self.lock = threading.Lock()
+        self.last_prune = time.monotonic()
+        self.allowed = Counter()
+        self.throttled = Counter()
+
+    def _limit(self, command: str, guild_id: Optional[int], scope: str) -> Optional[Tuple[float, float]]:
+        for limits in (self.guild_limits.get(guild_id, {}), self.limits):
+            for key in (command, 'default'):
+                if scope in limits.get(key, {}):
+                    return limits[key][scope]
+        return None
+
+    def _bucket(self, key: Tuple, limit: Tuple[float, float], now: float) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(limit[0], limit[1], now)
+        else:
+            bucket.refill(now)
+        return bucket
+
+    def _prune(self, now: float):
+        self.last_prune = now
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[key]
+
+    def check(self, command: str, guild_id: Optional[int], user_id: int) -> float:
+        """Consume a token for this call; returns 0 if allowed, otherwise seconds to wait"""
+        now = time.monotonic()
+        with self.lock:
+            if len(self.buckets) > self.PRUNE_THRESHOLD and now - self.last_prune >= self.PRUNE_INTERVAL:
+                self._prune(now)
+
+            buckets = []
+            user_limit = self._limit(command, guild_id, 'user')
+            if user_limit:
+                buckets.append(('user', self._bucket((command, guild_id, user_id), user_limit, now)))
+            guild_limit = self._limit(command, guild_id, 'guild')
+            if guild_limit and guild_id is not None:
+                buckets.append(('guild', self._bucket((command, guild_id), guild_limit, now)))
+
+            # Only take tokens when every bucket can pay, so a rejected call costs nothing
+            for scope, bucket in buckets:
+                if bucket.tokens < 1:
+                    self.throttled[(command, scope)] += 1
+                    return bucket.retry_after()
+            for _, bucket in buckets:
+                bucket.tokens -= 1
+            self.allowed[command] += 1
+            return 0.0
+
+    def snapshot(self):
+        """Allowed and throttled counts per command"""
+        with self.lock:
+            throttled = {}
+            for (command, scope), count in self.throttled.items():
+                throttled.setdefault(command, {})[scope] = count
+            return {
+                'allowed': dict(self.allowed),
+                'throttled': throttled,
+                'tracked_buckets': len(self.buckets)
+            }
+
+_rate_limiter: Optional[RateLimiter] = None
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide rate limiter"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(Config.RATE_LIMITS, Config.GUILD_RATE_LIMITS)
+    return _rate_limiter
@@ -0,0 +1,217 @@
+"""Cross-guild statistics kept as running counters.
+
+DataManager updates the counters on every mutation, so totals across all
+guilds can be answered without reading any guild files. Counters live in
+memory and are flushed to disk periodically; rebuild() recomputes what it
+can from the guild files if they ever drift.
+"""
+import atexit
+import contextlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+from storage_codec import CorruptFileError, read_file, write_file
+
+# Upper bounds in seconds for the approval latency histogram
+LATENCY_BUCKETS = [60, 600, 3600, 6 * 3600, 24 * 3600]
+
+def _empty_counters() -> Dict[str, Any]:
+    return {
+        'points_issued': 0,
+        'points_revoked': 0,
+        'points_spent': 0,
+        'points_refunded': 0,
+        'purchases_requested': 0,
+        'purchases_approved': 0,
+        'purchases_denied': 0,
+        'pending_purchases': 0,
+        'purchases_by_item': {},
+        'approval_latency': {
+            'count': 0,
+            'total_seconds': 0,
+            'max_seconds': 0,
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1)
+        },
+        'since': int(time.time()),
+        'rebuilt_at': None
+    }
+
+class StatsCounters:
+    def __init__(self, file_path: str, flush_interval: float = 5.0):
+        # Resolved now so a later chdir can't redirect the flush at exit
+        self.file_path = os.path.abspath(file_path)
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.last_flush = time.monotonic()
+
+        try:
+            self.counters = {**_empty_counters(), **read_file(file_path)}
+        except FileNotFoundError:
+            # First run with stats enabled; guilds may already have balances and pending purchases
+            print(f"Stats file {file_path} not found, building it from guild data")
+            self.counters = self._compute_from_data(Config.DATA_DIR)
+            self.dirty = True
+        except CorruptFileError as e:
+            print(f"Stats file {file_path} is corrupt ({e}), rebuilding from guild data")
+            self.counters = self._compute_from_data(Config.DATA_DIR)
+
+    def _changed(self):
+        """Mark counters dirty and flush if the last flush is old enough; lock must be held"""
+        self.dirty = True
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+        write_file(self.file_path, self.counters, Config.STORAGE_CODEC)
+        self.dirty = False
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        """Write counters to disk if they changed"""
+        with self.lock:
+            if self.dirty:
+                self._flush_locked()
+
+    def flush_at_exit(self):
+        """Final flush, skipped if the data directory is gone rather than re-creating it"""
+        with self.lock:
+            if self.dirty and os.path.isdir(os.path.dirname(self.file_path)):
+                self._flush_locked()
+
+    def record_points_changed(self, delta: int):
+        """Record staff giving (positive) or taking away (negative) points"""
+        if not delta:
+            return
+        with self.lock:
+            if delta > 0:
+                self.counters['points_issued'] += delta
+            else:
+                self.counters['points_revoked'] -= delta
+            self._changed()
+
+    def record_purchase_requested(self):
+        with self.lock:
+            self.counters['purchases_requested'] += 1
+            self.counters['pending_purchases'] += 1
+            self._changed()
+
+    def record_purchase_approved(self, item_name: str, cost: int, latency: Optional[int]):
+        with self.lock:
+            counters = self.counters
+            counters['purchases_approved'] += 1
+            counters['pending_purchases'] = max(0, counters['pending_purchases'] - 1)
+            counters['points_spent'] += cost
+            counters['purchases_by_item'][item_name] = counters['purchases_by_item'].get(item_name, 0) + 1
+
+            if latency is not None and latency >= 0:
+                stats = counters['approval_latency']
+                stats['count'] += 1
+                stats['total_seconds'] += latency
+                stats['max_seconds'] = max(stats['max_seconds'], latency)
+                bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+                stats['buckets'][bucket] += 1
+            self._changed()
+
+    def record_purchase_denied(self, refunded: int):
+        with self.lock:
+            self.counters['purchases_denied'] += 1
+            self.counters['pending_purchases'] = max(0, self.counters['pending_purchases'] - 1)
+            self.counters['points_refunded'] += refunded
+            self._changed()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a copy of the counters with derived values filled in"""
+        with self.lock:
+            latency = dict(self.counters['approval_latency'])
+            latency['buckets'] = list(latency['buckets'])
+            snapshot = {
+                **self.counters,
+                'purchases_by_item': dict(self.counters['purchases_by_item']),
+                'approval_latency': latency
+            }
+        latency['average_seconds'] = latency['total_seconds'] / latency['count'] if latency['count'] else None
+        latency['bucket_bounds'] = LATENCY_BUCKETS
+        return snapshot
+
+    def _compute_from_data(self, data_dir: str, hold_guild: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+        """Recompute counters from the guild files.
+
+        hold_guild, if given, is called with each guild id before its files are read.
+        Balances and purchase histories don't record when or at what price
+        points moved, so spent points use today's item prices, issued points
+        are balances plus spent plus held, and latency starts over.
+        """
+        counters = _empty_counters()
+        counters['rebuilt_at'] = int(time.time())
+        if not os.path.isdir(data_dir):
+            return counters
+
+        # Sorted so concurrent rebuilds take the guild locks in the same order
+        for entry in sorted(os.listdir(data_dir)):
+            guild_dir = os.path.join(data_dir, entry)
+            if not entry.startswith('guild_') or not os.path.isdir(guild_dir):
+                continue
+            guild_id = entry[len('guild_'):]
+            if hold_guild is not None and guild_id.isdigit():
+                hold_guild(int(guild_id))
+            guild_files = {}
+            for file_name in ('users.json', 'stock.json', 'pending_purchases.json'):
+                try:
+                    guild_files[file_name] = read_file(os.path.join(guild_dir, file_name))
+                except (FileNotFoundError, CorruptFileError):
+                    guild_files[file_name] = {}
+
+            stock = guild_files['stock.json']
+            held = 0
+            for purchases in guild_files['pending_purchases.json'].values():
+                counters['pending_purchases'] += len(purchases)
+                held += sum(p['cost'] for p in purchases if p.get('held'))
+
+            spent = 0
+            balances = 0
+            for user in guild_files['users.json'].values():
+                balances += user.get('balance', 0)
+                for item_name, count in user.get('purchases', {}).items():
+                    counters['purchases_by_item'][item_name] = counters['purchases_by_item'].get(item_name, 0) + count
+                    counters['purchases_approved'] += count
+                    spent += count * stock.get(item_name, {}).get('cost', 0)
+
+            counters['points_spent'] += spent
+            counters['points_issued'] += balances + spent + held
+
+        # Denied purchases leave no trace, so only approved and pending ones can be counted
+        counters['purchases_requested'] = counters['purchases_approved'] + counters['pending_purchases']
+        return counters
+
+    def rebuild(self, data_dir: str = Config.DATA_DIR) -> Dict[str, Any]:
+        """Replace the counters with values recomputed from the guild files.
+
+        DataManager records into the counters while holding the guild lock, so
+        holding every guild lock until the swap means no update can land
+        between a guild being read and the new counters taking over.
+        """
+        from data_manager import get_guild_lock
+
+        with contextlib.ExitStack() as held:
+            counters = self._compute_from_data(data_dir, lambda guild_id: held.enter_context(get_guild_lock(guild_id)))
+            with self.lock:
+                self.counters = counters
+                self._flush_locked()
+        return self.snapshot()
+
+_stats: Optional[StatsCounters] = None
+_stats_guard = threading.Lock()
+
+def get_stats() -> StatsCounters:
+    """Get the process-wide stats counters"""
+    global _stats
+    with _stats_guard:
+        if _stats is None:
+            _stats = StatsCounters(Config.STATS_FILE)
+            atexit.register(_stats.flush_at_exit)
+        return _stats
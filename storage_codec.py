@@ -0,0 +1,147 @@
+"""Serialization codecs for the bot's data files.
+
+The "json" codec writes plain pretty-printed JSON exactly as before, so
+other tools can keep reading the files. The "compact" and "binary" codecs
+start every file with a one-line header:
+
+    TSD1 <codec> <crc32> <length>\n
+
+followed by the encoded payload. The header lets readers pick the right
+codec and tell a truncated or corrupt file from a genuinely empty one, but
+it means those files are no longer plain JSON. Files without a header are
+read as legacy JSON.
+"""
+import io
+import json
+import marshal
+import os
+import pickle
+import threading
+import zlib
+from typing import Any, Dict
+
+MAGIC = b"TSD"
+FORMAT_VERSION = 1
+
+class CorruptFileError(ValueError):
+    """Raised when a data file is truncated, fails its checksum or cannot be decoded"""
+
+class JSONCodec:
+    """Pretty-printed JSON with no header, identical to the legacy format"""
+    name = "json"
+
+    def encode(self, data: Any) -> bytes:
+        return json.dumps(data, indent=2).encode('utf-8')
+
+    def decode(self, payload: bytes) -> Any:
+        return json.loads(payload)
+
+class CompactJSONCodec:
+    """JSON without indentation or spaces.
+
+    Files carry the TSD1 header line, so JSON tools need to skip the first line.
+    """
+    name = "compact"
+
+    def encode(self, data: Any) -> bytes:
+        return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    def decode(self, payload: bytes) -> Any:
+        return json.loads(payload)
+
+class _PlainUnpickler(pickle.Unpickler):
+    """Unpickler that only rebuilds plain data, never imports or calls anything"""
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"refusing to load {module}.{name}")
+
+class BinaryCodec:
+    """pickle with a pinned protocol; faster to decode than JSON for plain dicts, lists and numbers.
+
+    Protocol 4 stays readable by every later Python. Payloads may only hold
+    builtin types. Files written by the earlier marshal version of this
+    codec are still read, and are rewritten as pickle on the next save.
+    """
+    name = "binary"
+    PROTOCOL = 4
+
+    def encode(self, data: Any) -> bytes:
+        return pickle.dumps(data, protocol=self.PROTOCOL)
+
+    def decode(self, payload: bytes) -> Any:
+        # A pickle always opens with the PROTO opcode, which is never a valid marshal type byte
+        if not payload.startswith(pickle.PROTO):
+            return marshal.loads(payload)
+        return _PlainUnpickler(io.BytesIO(payload)).load()
+
+CODECS: Dict[str, Any] = {codec.name: codec for codec in (JSONCodec(), CompactJSONCodec(), BinaryCodec())}
+
+def get_codec(name: str):
+    """Look up a codec by name"""
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown storage codec {name!r}, expected one of {', '.join(CODECS)}")
+
+def encode_file(data: Any, codec_name: str) -> bytes:
+    """Encode data, with a version header and checksum unless it's legacy json"""
+    payload = get_codec(codec_name).encode(data)
+    if codec_name == JSONCodec.name:
+        return payload
+    header = f"{MAGIC.decode('ascii')}{FORMAT_VERSION} {codec_name} {zlib.crc32(payload):08x} {len(payload)}\n"
+    return header.encode('ascii') + payload
+
+def decode_file(raw: bytes) -> Any:
+    """Decode file contents written by encode_file, or legacy plain JSON"""
+    if not raw.startswith(MAGIC):
+        if not raw.strip():
+            raise CorruptFileError("file is empty")
+        try:
+            return json.loads(raw)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise CorruptFileError(f"invalid legacy JSON: {e}") from e
+
+    header, _, payload = raw.partition(b"\n")
+    try:
+        version, codec_name, checksum, length = header.decode('ascii').split(' ')
+        version = int(version[len(MAGIC):])
+        checksum = int(checksum, 16)
+        length = int(length)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise CorruptFileError(f"invalid header {header[:64]!r}") from e
+
+    if version != FORMAT_VERSION:
+        raise CorruptFileError(f"unsupported format version {version}")
+    if len(payload) < length:
+        raise CorruptFileError(f"truncated: expected {length} bytes, found {len(payload)}")
+    if len(payload) > length:
+        raise CorruptFileError(f"length mismatch: expected {length} bytes, found {len(payload)}")
+    if zlib.crc32(payload) != checksum:
+        raise CorruptFileError("checksum mismatch")
+
+    try:
+        return get_codec(codec_name).decode(payload)
+    except Exception as e:
+        raise CorruptFileError(f"could not decode {codec_name} payload: {e}") from e
+
+def read_file(file_path: str) -> Any:
+    """Read and decode a data file; FileNotFoundError propagates"""
+    with open(file_path, 'rb') as f:
+        return decode_file(f.read())
+
+def write_file(file_path: str, data: Any, codec_name: str):
+    """Encode and atomically replace a data file"""
+    encoded = encode_file(data, codec_name)
+    tmp_path = f"{file_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(encoded)
+            # The data must be on disk before the rename, or a crash can leave the new name pointing at nothing
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,81 @@
+"""Bounded cache of recently active users with coalesced on-demand fetches.
+
+Used instead of discord.py's full member cache when MEMBER_CACHE_MODE is
+"lru": only users who recently interacted with the bot are kept, and anyone
+else is fetched from the API when needed. Concurrent lookups of the same
+missing user share a single fetch.
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import discord
+
+class UserCache:
+    def __init__(self, client: discord.Client, max_size: int = 1000):
+        self.client = client
+        self.max_size = max_size
+        self._users: "OrderedDict[int, discord.abc.User]" = OrderedDict()
+        self._fetches: Dict[int, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    def remember(self, user: discord.abc.User):
+        """Mark a user as recently active, evicting the least recently used"""
+        self._users[user.id] = user
+        self._users.move_to_end(user.id)
+        while len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+
+    def clear(self):
+        """Forget every cached user; fetches already in flight still complete"""
+        self._users.clear()
+
+    def get(self, user_id: int) -> Optional[discord.abc.User]:
+        """Look a user up without touching the API"""
+        user = self._users.get(user_id)
+        if user is not None:
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return user
+
+        user = self.client.get_user(user_id)
+        if user is not None:
+            self.remember(user)
+            self.hits += 1
+        return user
+
+    async def fetch(self, user_id: int) -> Optional[discord.abc.User]:
+        """Get a user from the cache, fetching them once if missing; None if they don't exist"""
+        user = self.get(user_id)
+        if user is not None:
+            return user
+
+        self.misses += 1
+        task = self._fetches.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(user_id))
+            self._fetches[user_id] = task
+        # Shielded so one caller giving up doesn't cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    async def _fetch(self, user_id: int) -> Optional[discord.abc.User]:
+        self.fetches += 1
+        try:
+            user = await self.client.fetch_user(user_id)
+        except discord.NotFound:
+            return None
+        finally:
+            self._fetches.pop(user_id, None)
+        self.remember(user)
+        return user
+
+    def snapshot(self):
+        return {
+            'size': len(self._users),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'fetches': self.fetches
+        }